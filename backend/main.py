@@ -1,25 +1,34 @@
 import os
+import re
 import math
-import joblib
 import httpx
+import orjson
 import asyncio
-import numpy as np
 import time
 import smtplib
 import random
+import secrets
+import hashlib
 import logging
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from google import genai
+from google.genai import types
+from twilio.rest import Client as TwilioClient
+from twilio.base.exceptions import TwilioRestException
 from fastapi import FastAPI, Body
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, JSONResponse
 from pydantic import BaseModel
-from sklearn.ensemble import RandomForestClassifier, RandomForestRegressor
+from typing import NamedTuple
+from cachetools import TTLCache
 from dotenv import load_dotenv
 from functools import lru_cache
-from datetime import datetime, timedelta
+from contextlib import asynccontextmanager
+from itertools import count, islice, zip_longest
+from collections import deque
+from datetime import datetime
 
 # Configure logging
 logging.basicConfig(
@@ -35,8 +44,60 @@ if not GEMINI_API_KEY:
     raise ValueError("GEMINI_API_KEY not found in .env file")
 
 client = genai.Client(api_key=GEMINI_API_KEY)
+GEMINI_MODEL = "gemini-2.5-flash"
 
-app = FastAPI()
+# Twilio SMS credentials
+TWILIO_SID = os.getenv("TWILIO_ACCOUNT_SID", "")
+TWILIO_TOKEN = os.getenv("TWILIO_AUTH_TOKEN", "")
+TWILIO_PHONE = os.getenv("TWILIO_PHONE_NUMBER", "")
+# Optional Messaging Service: Twilio then spreads sends across the service's number pool
+TWILIO_MESSAGING_SERVICE_SID = os.getenv("TWILIO_MESSAGING_SERVICE_SID", "")
+TWILIO_ENABLED = bool(TWILIO_SID and TWILIO_TOKEN and (TWILIO_PHONE or TWILIO_MESSAGING_SERVICE_SID))
+TWILIO_SENDER = (
+    {"messaging_service_sid": TWILIO_MESSAGING_SERVICE_SID}
+    if TWILIO_MESSAGING_SERVICE_SID
+    else {"from_": TWILIO_PHONE}
+)
+# A single long code sends ~1 SMS/sec; a Messaging Service pool can go faster (roughly 1/sec per number)
+TWILIO_MAX_SENDS_PER_SEC = int(os.getenv("TWILIO_MAX_SENDS_PER_SEC", "1")) if TWILIO_MESSAGING_SERVICE_SID else 1
+
+# Optional Redis for alert state shared across workers; in-process storage is used without it
+REDIS_URL = os.getenv("REDIS_URL", "")
+if REDIS_URL:
+    import redis.asyncio as aioredis
+    redis_client = aioredis.Redis(connection_pool=aioredis.ConnectionPool.from_url(REDIS_URL, decode_responses=True))
+else:
+    redis_client = None
+
+# Email provider is only imported when configured
+RESEND_API_KEY = os.getenv("RESEND_API_KEY", "")
+if RESEND_API_KEY:
+    import resend
+    resend.api_key = RESEND_API_KEY
+
+# Shared HTTP client so upstream calls reuse pooled keep-alive (HTTP/2) connections
+HTTP_CLIENT = httpx.AsyncClient(
+    http2=True,
+    timeout=httpx.Timeout(10.0),
+    limits=httpx.Limits(max_connections=100, max_keepalive_connections=50)
+)
+
+class ORJSONResponse(JSONResponse):
+    """JSON response rendered with orjson instead of the stdlib encoder"""
+    def render(self, content) -> bytes:
+        return orjson.dumps(content)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # One Twilio client per worker, reused for every SMS
+    app.state.twilio_client = TwilioClient(TWILIO_SID, TWILIO_TOKEN) if TWILIO_ENABLED else None
+    yield
+    await HTTP_CLIENT.aclose()
+    await client.aio.aclose()
+    if redis_client is not None:
+        await redis_client.aclose()
+
+app = FastAPI(lifespan=lifespan, default_response_class=ORJSONResponse)
 
 # Configure CORS to allow frontend connections
 app.add_middleware(
@@ -48,11 +109,10 @@ app.add_middleware(
         "http://localhost:3000",                  # Alternative port
         "http://127.0.0.1:5173",
         "http://127.0.0.1:3000",
-        "*",  # Allow all origins for now (remove in production)
     ],
     allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
+    allow_methods=["GET", "POST", "DELETE"],  # DELETE is used by /alert/history
+    allow_headers=["Content-Type", "Authorization"],
 )
 
 MODEL_DIR = "ml_models"
@@ -70,6 +130,16 @@ class SimulationInput(BaseModel):
     drainage_density: float = 1.5 
     use_live_weather: bool = False
 
+_PHONE_SEPARATORS = re.compile(r"[\s\-()]")
+_PHONE_RE = re.compile(r"\+?\d{10,15}")
+
+def _normalize_phone(phone: str) -> str:
+    """Canonical E.164 form; bare numbers are assumed to be Indian (+91)"""
+    phone = _PHONE_SEPARATORS.sub("", phone)
+    if not _PHONE_RE.fullmatch(phone):
+        raise ValueError("Phone number must be 10-15 digits, optionally starting with +")
+    return phone if phone.startswith('+') else f"+91{phone}"
+
 class AlertSettings(BaseModel):
     email: str = ""
     phone: str = ""
@@ -82,50 +152,179 @@ class AlertSettings(BaseModel):
     alert_lat: float = None
     alert_lng: float = None
 
+_DEFAULT_ALERT_SETTINGS = AlertSettings().model_dump()
+
+class AlertCheckInput(BaseModel):
+    # int | float keeps whole numbers as ints, so alert messages read "75%" rather than "75.0%"
+    landslide_risk: int | float = 0
+    flood_risk: int | float = 0
+    rainfall: int | float = 0
+    location: str = "Unknown Location"
+
+class SendOtpInput(BaseModel):
+    user_id: str = "default"
+    phone: str = ""
+
+class VerifyOtpInput(BaseModel):
+    user_id: str = "default"
+    otp: str = ""
+
 # --- 3. SERVICES ---
+async def _cached_lookup(cache, inflight: dict, key, fetch):
+    """Return cache[key], coalescing concurrent misses on the same key into a single fetch.
+    `fetch` returns None on failure, which is passed through without being cached."""
+    if key in cache:
+        return cache[key]
+    task = inflight.get(key)
+    if task is None:
+        task = asyncio.ensure_future(fetch())
+        inflight[key] = task
+        task.add_done_callback(lambda _: inflight.pop(key, None))
+    result = await asyncio.shield(task)
+    if result is not None:
+        cache[key] = result
+    return result
+
 class ElevationService:
     def __init__(self):
         self.url = "https://api.open-meteo.com/v1/elevation"
+        # Terrain is static, so cache per ~100m tile (coords rounded to 3 decimals) for a day
+        self.cache = TTLCache(maxsize=10000, ttl=86400)
+        self.inflight = {}
 
-    async def get_slope_and_elevation(self, lat: float, lon: float):
-        # Fetches elevation for center and 4 surrounding points to calculate slope
+    @staticmethod
+    def _slope_coords(lat: float, lon: float):
+        # Center and 4 surrounding points used to calculate slope
         delta = 0.0008 
-        coords = [(lat, lon), (lat + delta, lon), (lat - delta, lon), (lat, lon + delta), (lat, lon - delta)]
-        lats = ",".join([str(c[0]) for c in coords])
-        lons = ",".join([str(c[1]) for c in coords])
-        
-        async with httpx.AsyncClient() as client:
-            try:
-                resp = await client.get(self.url, params={"latitude": lats, "longitude": lons})
-                elevs = resp.json().get("elevation", [500]*5)
-                z_c, z_n, z_s, z_e, z_w = elevs
-                dist = 90.0 
-                dz_dx = (z_e - z_w) / (2 * dist)
-                dz_dy = (z_n - z_s) / (2 * dist)
-                slope = math.degrees(math.atan(math.sqrt(dz_dx**2 + dz_dy**2)))
-                return round(slope, 2), z_c
-            except: return 15.0, 500.0
-
-    async def get_profile(self, lat: float, lon: float):
-        # Generates 10 points for the Terrain Profile Chart
-        lats = [lat + (i * 0.001) for i in range(-5, 5)]
-        lons = [lon] * 10
-        async with httpx.AsyncClient() as client:
-            try:
-                resp = await client.get(self.url, params={
-                    "latitude": ",".join(map(str, lats)), 
-                    "longitude": ",".join(map(str, lons))
-                })
-                return resp.json().get("elevation", [])
-            except: return [500] * 10
+        return [(lat, lon), (lat + delta, lon), (lat - delta, lon), (lat, lon + delta), (lat, lon - delta)]
+
+    @staticmethod
+    def _profile_coords(lat: float, lon: float):
+        # 10 points for the Terrain Profile Chart
+        return [(lat + (i * 0.001), lon) for i in range(-5, 5)]
+
+    @staticmethod
+    def _slope_from_elevations(elevs):
+        # Central differences over the N/S and E/W neighbours
+        z_c, z_n, z_s, z_e, z_w = elevs
+        dist = 90.0 
+        dz_dx = (z_e - z_w) / (2 * dist)
+        dz_dy = (z_n - z_s) / (2 * dist)
+        slope = math.degrees(math.atan(math.hypot(dz_dx, dz_dy)))
+        return round(slope, 2), z_c
+
+    async def _fetch_elevations(self, coords):
+        resp = await HTTP_CLIENT.get(self.url, params={
+            "latitude": ",".join(str(c[0]) for c in coords), 
+            "longitude": ",".join(str(c[1]) for c in coords)
+        })
+        resp.raise_for_status()
+        return orjson.loads(resp.content).get("elevation", [500] * len(coords))
+
+    async def get_slope_and_profile(self, lat: float, lon: float):
+        key = (round(lat, 3), round(lon, 3))
+        result = await _cached_lookup(self.cache, self.inflight, key, lambda: self._fetch_slope_and_profile(lat, lon))
+        return result if result is not None else (15.0, 500.0, [500] * 10)
+
+    async def _fetch_slope_and_profile(self, lat: float, lon: float):
+        # One batched request: 5 slope points followed by the 10 profile points
+        coords = self._slope_coords(lat, lon) + self._profile_coords(lat, lon)
+        try:
+            elevs = await self._fetch_elevations(coords)
+            slope, elev = self._slope_from_elevations(elevs[:5])
+            return slope, elev, elevs[5:]
+        except: return None
+
+class TokenBucket:
+    """Rate limiter replenishing request and token budgets per minute"""
+    def __init__(self, rpm: int, tpm: int):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.request_tokens = float(rpm)
+        self.token_tokens = float(tpm)
+        self.last_refill = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed = now - self.last_refill
+        self.request_tokens = min(self.rpm, self.request_tokens + elapsed * self.rpm / 60)
+        self.token_tokens = min(self.tpm, self.token_tokens + elapsed * self.tpm / 60)
+        self.last_refill = now
+
+    async def acquire(self, estimated_tokens: int):
+        # Waits until both budgets can cover the call, then consumes them
+        estimated_tokens = min(estimated_tokens, self.tpm)
+        async with self.lock:
+            self._refill()
+            wait_time = max(
+                (1 - self.request_tokens) * 60 / self.rpm,
+                (estimated_tokens - self.token_tokens) * 60 / self.tpm,
+                0
+            )
+            if wait_time > 0:
+                await asyncio.sleep(wait_time)
+                self._refill()
+            self.request_tokens -= 1
+            self.token_tokens -= estimated_tokens
+
+class SlidingWindowLimiter:
+    """Allows at most `max_events` within any `window`-second span, waiting when full"""
+    def __init__(self, max_events: int, window: float):
+        self.max_events = max_events
+        self.window = window
+        self.times = deque()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self.lock:
+            now = time.monotonic()
+            while self.times and now - self.times[0] >= self.window:
+                self.times.popleft()
+            if len(self.times) >= self.max_events:
+                await asyncio.sleep(self.window - (now - self.times[0]))
+                self.times.popleft()
+            self.times.append(time.monotonic())
+
+class AIMDLimiter:
+    """Concurrency limit that grows by one on success and halves on overload (AIMD)"""
+    def __init__(self, initial: int, maximum: int):
+        self.limit = initial
+        self.maximum = maximum
+        self.in_flight = 0
+        self.resume_at = 0.0
+        self.cond = asyncio.Condition()
+
+    async def __aenter__(self):
+        delay = self.resume_at - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        async with self.cond:
+            await self.cond.wait_for(lambda: self.in_flight < self.limit)
+            self.in_flight += 1
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        async with self.cond:
+            self.in_flight -= 1
+            self.cond.notify_all()
+
+    def success(self):
+        self.limit = min(self.maximum, self.limit + 1)
+
+    def overload(self, retry_after: float):
+        self.limit = max(1, self.limit // 2)
+        self.resume_at = max(self.resume_at, time.monotonic() + retry_after)
 
 # --- 4. ROUTES ---
 elevation_service = ElevationService()
+gemini_rate_limiter = TokenBucket(rpm=60, tpm=60000)
+sms_rate_limiter = SlidingWindowLimiter(max_events=TWILIO_MAX_SENDS_PER_SEC, window=1.0)  # Twilio's per-sender MPS cap
+sms_concurrency = AIMDLimiter(initial=4, maximum=16)
 
 @app.post("/simulate")
 async def simulate(input_data: SimulationInput):
-    slope, elev = await elevation_service.get_slope_and_elevation(input_data.lat, input_data.lon)
-    profile = await elevation_service.get_profile(input_data.lat, input_data.lon)
+    slope, elev, profile = await elevation_service.get_slope_and_profile(input_data.lat, input_data.lon)
     
     # Simple risk logic for demonstration
     risk = min(100, (slope * 2) + (input_data.rainfall_intensity / 2))
@@ -141,6 +340,21 @@ async def simulate(input_data: SimulationInput):
     }
     return {"status": "success", "results": res}
 
+# Bounded explanation cache of (text, expiry) entries; AI answers live 30 minutes, fallbacks 10
+EXPLANATION_TTL = 1800
+FALLBACK_EXPLANATION_TTL = 600
+_EXPLANATION_CACHE = TTLCache(maxsize=2048, ttl=EXPLANATION_TTL)
+
+# Fixed analyst instruction, sent as the system instruction so only the risk values vary per call
+ANALYST_INSTRUCTION = """You are a mountain disaster risk analyst. Analyze the situation you are given.
+
+Provide:
+1. Risk assessment (2-3 sentences explaining what the numbers mean)
+2. Why this is concerning or safe (geological perspective)
+3. Immediate safety recommendation (specific action)
+
+Keep response under 100 words, professional tone."""
+
 @app.post("/chat_explanation")
 async def chat_explanation(risk_data: dict = Body(...)):
     # Optimized AI explanation with aggressive caching and rate limiting
@@ -149,49 +363,32 @@ async def chat_explanation(risk_data: dict = Body(...)):
     rainfall = risk_data.get('rainfall_intensity', 0)
     
     # Create cache key with broader ranges for better cache hits (reduces API calls by ~90%)
-    cache_key = f"{round(landslide/15)*15}_{round(slope/10)*10}_{round(rainfall/15)*15}"
-    
-    # Initialize cache and rate limiter
-    if not hasattr(chat_explanation, 'cache'):
-        chat_explanation.cache = {}
-        chat_explanation.cache_time = {}
-        chat_explanation.last_api_call = 0
+    cache_key = hashlib.sha256(
+        f"{GEMINI_MODEL}|{round(landslide/15)*15}|{round(slope/10)*10}|{round(rainfall/15)*15}".encode()
+    ).digest()
     
     current_time = time.time()
+    entry = _EXPLANATION_CACHE.get(cache_key)
+    if entry and entry[1] > current_time:
+        return {"explanation": entry[0]}
     
-    # Return cached response if less than 30 minutes old (increased from 5 min)
-    if cache_key in chat_explanation.cache:
-        if current_time - chat_explanation.cache_time.get(cache_key, 0) < 1800:
-            return {"explanation": chat_explanation.cache[cache_key]}
-    
-    # Rate limiting: Max 1 API call every 5 seconds
-    time_since_last_call = current_time - chat_explanation.last_api_call
-    if time_since_last_call < 5:
-        # Use fallback if requesting too frequently
-        fallback = generate_fallback_explanation(landslide, slope, rainfall)
-        return {"explanation": fallback}
-    
-    # Enhanced prompt with more detailed context
-    prompt = f"""You are a mountain disaster risk analyst. Analyze this situation:
-
-Location: Mountain terrain
+    # Only the situation varies per call; the analyst instruction goes in system_instruction
+    prompt = f"""Location: Mountain terrain
 Landslide Risk: {landslide}%
 Terrain Slope: {slope}°
-Current Rainfall: {rainfall}mm/hr
-
-Provide:
-1. Risk assessment (2-3 sentences explaining what the numbers mean)
-2. Why this is concerning or safe (geological perspective)
-3. Immediate safety recommendation (specific action)
-
-Keep response under 100 words, professional tone."""
+Current Rainfall: {rainfall}mm/hr"""
     
     try:
-        chat_explanation.last_api_call = current_time
+        # Rate limiting: token bucket over Gemini's request and token quotas (~4 chars per token)
+        await gemini_rate_limiter.acquire((len(ANALYST_INSTRUCTION) + len(prompt)) // 4)
         
-        response = client.models.generate_content(
-            model='gemini-2.5-flash',
-            contents=prompt
+        config = types.GenerateContentConfig(system_instruction=ANALYST_INSTRUCTION)
+        
+        # Native async SDK call keeps the event loop free while Gemini responds
+        response = await client.aio.models.generate_content(
+            model=GEMINI_MODEL,
+            contents=prompt,
+            config=config
         )
         raw_text = response.text if hasattr(response, 'text') else str(response)
         
@@ -199,8 +396,7 @@ Keep response under 100 words, professional tone."""
         formatted_text = beautify_ai_response(raw_text)
         
         # Cache successful response
-        chat_explanation.cache[cache_key] = formatted_text
-        chat_explanation.cache_time[cache_key] = current_time
+        _EXPLANATION_CACHE[cache_key] = (formatted_text, current_time + EXPLANATION_TTL)
         
         return {"explanation": formatted_text}
     except Exception as e:
@@ -211,18 +407,29 @@ Keep response under 100 words, professional tone."""
         fallback = generate_fallback_explanation(landslide, slope, rainfall)
         
         # Cache fallback for 10 minutes to avoid repeated failed calls
-        chat_explanation.cache[cache_key] = fallback
-        chat_explanation.cache_time[cache_key] = current_time
+        _EXPLANATION_CACHE[cache_key] = (fallback, current_time + FALLBACK_EXPLANATION_TTL)
         
         return {"explanation": fallback}
 
+# Precompiled patterns for beautify_ai_response
+_BOLD_RE = re.compile(r'\*\*(.+?)\*\*')
+_ITALIC_RE = re.compile(r'\*(.+?)\*')
+_SAFETY_RES = [
+    re.compile(p, re.IGNORECASE | re.DOTALL) for p in (
+        r'(?:Safety Recommendation|Immediate Safety Recommendation|Safety Action):\s*(.+?)(?:\n|$)',
+        r'(?:Recommendation|Action):\s*(.+?)(?:\n|$)',
+        r'\d+\.\s*(?:Immediate safety recommendation|Safety recommendation).*?:\s*(.+?)(?:\n|$)',
+    )
+]
+_SENTENCE_SPLIT = re.compile(r'(?<=[.!?])\s+')
+_NUM_LIST = re.compile(r'\d+\.\s*')
+_WS = re.compile(r'\s+')
+
 def beautify_ai_response(raw_text):
     """Clean and format AI response for better readability with enhanced structure"""
-    import re
-    
     # Remove markdown formatting and asterisks
-    text = re.sub(r'\*\*(.+?)\*\*', r'\1', raw_text)  # Remove bold markdown
-    text = re.sub(r'\*(.+?)\*', r'\1', text)  # Remove italic markdown
+    text = _BOLD_RE.sub(r'\1', raw_text)  # Remove bold markdown
+    text = _ITALIC_RE.sub(r'\1', text)  # Remove italic markdown
     
     # Remove excessive formalities and verbose phrases
     text = text.replace("You are a mountain disaster risk analyst.", "")
@@ -233,24 +440,18 @@ def beautify_ai_response(raw_text):
     text = text.replace("my assessment is,", "")
     
     # Extract safety recommendation/action (multiple patterns)
-    safety_patterns = [
-        r'(?:Safety Recommendation|Immediate Safety Recommendation|Safety Action):\s*(.+?)(?:\n|$)',
-        r'(?:Recommendation|Action):\s*(.+?)(?:\n|$)',
-        r'\d+\.\s*(?:Immediate safety recommendation|Safety recommendation).*?:\s*(.+?)(?:\n|$)',
-    ]
-    
     safety_tip = None
-    for pattern in safety_patterns:
-        match = re.search(pattern, text, re.IGNORECASE | re.DOTALL)
+    for pattern in _SAFETY_RES:
+        match = pattern.search(text)
         if match:
             safety_tip = match.group(1).strip()
             # Remove the matched safety section from main text
-            text = re.sub(pattern, '', text, flags=re.IGNORECASE | re.DOTALL)
+            text = pattern.sub('', text)
             break
     
     # If no structured safety tip found, try to extract last sentence as safety tip
     if not safety_tip:
-        sentences = re.split(r'(?<=[.!?])\s+', text.strip())
+        sentences = _SENTENCE_SPLIT.split(text.strip())
         if len(sentences) > 3:
             # Check if last sentence contains safety-related keywords
             last_sentence = sentences[-1]
@@ -260,8 +461,8 @@ def beautify_ai_response(raw_text):
                 text = ' '.join(sentences[:-1])
     
     # Clean up numbered lists and structure
-    text = re.sub(r'\d+\.\s*', '', text)  # Remove numbered list markers
-    text = re.sub(r'\s+', ' ', text)  # Collapse multiple spaces
+    text = _NUM_LIST.sub('', text)  # Remove numbered list markers
+    text = _WS.sub(' ', text)  # Collapse multiple spaces
     text = text.strip()
     
     # Split into paragraphs if multiple sections exist
@@ -271,7 +472,7 @@ def beautify_ai_response(raw_text):
         main_text = '\n\n'.join(paragraphs[:2])  # Take first 2 paragraphs
     else:
         # Limit to reasonable length if single paragraph
-        sentences = re.split(r'(?<=[.!?])\s+', text)
+        sentences = _SENTENCE_SPLIT.split(text)
         main_text = ' '.join(sentences[:5])  # Up to 5 sentences
     
     # Format the final output with emoji and clear structure
@@ -286,20 +487,31 @@ def beautify_ai_response(raw_text):
     
     return formatted
 
+# Static fallback fragments indexed by risk tier (0 = low, 1 = moderate, 2 = high)
+_FALLBACK_RISK_LEVEL = (
+    "<strong style='color: #10b981;'>low risk conditions</strong>",
+    "<strong style='color: #f59e0b;'>moderate risk conditions</strong>",
+    "<strong style='color: #ef4444;'>high risk conditions</strong>",
+)
+_FALLBACK_PERSPECTIVE = (
+    "<div style='margin-top: 16px; padding: 12px; background: rgba(51, 65, 85, 0.3); border-left: 3px solid #10b981; border-radius: 4px;'><strong style='color: #86efac;'>Geological Perspective:</strong> Current conditions show acceptable stability margins. While risk exists in any mountain terrain, immediate hazard probability remains low under present circumstances.</div>",
+    "<div style='margin-top: 16px; padding: 12px; background: rgba(51, 65, 85, 0.3); border-left: 3px solid #f59e0b; border-radius: 4px;'><strong style='color: #fcd34d;'>Geological Perspective:</strong> Moderate instability indicates the area is approaching threshold conditions where ground failure could occur. Preventative measures and continuous monitoring are essential.</div>",
+    "<div style='margin-top: 16px; padding: 12px; background: rgba(51, 65, 85, 0.3); border-left: 3px solid #ef4444; border-radius: 4px;'><strong style='color: #fca5a5;'>Geological Perspective:</strong> Critical instability conditions exist. The combination of terrain geometry and environmental factors creates imminent failure potential requiring immediate protective response.</div>",
+)
+_FALLBACK_SAFETY_TIP = (
+    "<div class='safety-action'><strong>Safety Action:</strong> Maintain situational awareness and keep emergency supplies accessible. Stay informed through local disaster management channels.</div>",
+    "<div class='safety-action'><strong>Safety Action:</strong> Identify and prepare evacuation routes. Monitor for warning signs like ground cracks, tilting structures, or sudden water flow changes. Stay alert to weather updates.</div>",
+    "<div class='safety-action'><strong>Safety Action:</strong> Evacuate to higher, stable ground immediately. Avoid valleys, drainage paths, and steep slopes. Alert local authorities and neighbors.</div>",
+)
+
 def generate_fallback_explanation(landslide_risk, slope, rainfall):
     """Generate a detailed rule-based explanation when AI is unavailable"""
     
-    # Determine risk classifications with HTML formatting
-    risk_level_html = ""
-    if landslide_risk > 70:
-        risk_level_html = "<strong style='color: #ef4444;'>high risk conditions</strong>"
-    elif landslide_risk > 40:
-        risk_level_html = "<strong style='color: #f59e0b;'>moderate risk conditions</strong>"
-    else:
-        risk_level_html = "<strong style='color: #10b981;'>low risk conditions</strong>"
+    # Determine risk tier; HTML fragments for each tier are precomputed above
+    tier = 2 if landslide_risk > 70 else 1 if landslide_risk > 40 else 0
     
     # Build comprehensive risk assessment with HTML formatting
-    assessment = f"Current landslide risk stands at <strong>{landslide_risk:.1f}%</strong>, indicating {risk_level_html}. "
+    assessment = f"Current landslide risk stands at <strong>{landslide_risk:.1f}%</strong>, indicating {_FALLBACK_RISK_LEVEL[tier]}. "
     
     # Add slope analysis
     if slope > 30:
@@ -319,82 +531,101 @@ def generate_fallback_explanation(landslide_risk, slope, rainfall):
     else:
         assessment += "Current <strong>dry conditions</strong> provide a favorable factor, as soil moisture levels are not being elevated by precipitation."
     
-    # Determine geological perspective and safety action based on risk level
-    if landslide_risk > 70:
-        perspective = "<div style='margin-top: 16px; padding: 12px; background: rgba(51, 65, 85, 0.3); border-left: 3px solid #ef4444; border-radius: 4px;'><strong style='color: #fca5a5;'>Geological Perspective:</strong> Critical instability conditions exist. The combination of terrain geometry and environmental factors creates imminent failure potential requiring immediate protective response.</div>"
-        safety_tip = "<div class='safety-action'><strong>Safety Action:</strong> Evacuate to higher, stable ground immediately. Avoid valleys, drainage paths, and steep slopes. Alert local authorities and neighbors.</div>"
-    elif landslide_risk > 40:
-        perspective = "<div style='margin-top: 16px; padding: 12px; background: rgba(51, 65, 85, 0.3); border-left: 3px solid #f59e0b; border-radius: 4px;'><strong style='color: #fcd34d;'>Geological Perspective:</strong> Moderate instability indicates the area is approaching threshold conditions where ground failure could occur. Preventative measures and continuous monitoring are essential.</div>"
-        safety_tip = "<div class='safety-action'><strong>Safety Action:</strong> Identify and prepare evacuation routes. Monitor for warning signs like ground cracks, tilting structures, or sudden water flow changes. Stay alert to weather updates.</div>"
-    else:
-        perspective = "<div style='margin-top: 16px; padding: 12px; background: rgba(51, 65, 85, 0.3); border-left: 3px solid #10b981; border-radius: 4px;'><strong style='color: #86efac;'>Geological Perspective:</strong> Current conditions show acceptable stability margins. While risk exists in any mountain terrain, immediate hazard probability remains low under present circumstances.</div>"
-        safety_tip = "<div class='safety-action'><strong>Safety Action:</strong> Maintain situational awareness and keep emergency supplies accessible. Stay informed through local disaster management channels.</div>"
-    
-    return f"<div style='line-height: 1.8;'>{assessment}</div>{perspective}{safety_tip}"
+    return f"<div style='line-height: 1.8;'>{assessment}</div>{_FALLBACK_PERSPECTIVE[tier]}{_FALLBACK_SAFETY_TIP[tier]}"
 
 @app.get("/weather_forecast")
 async def weather_forecast(lat: float, lon: float):
     """Fetch 24-hour hourly weather forecast including rainfall"""
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.get(
-                "https://api.open-meteo.com/v1/forecast",
-                params={
-                    "latitude": lat,
-                    "longitude": lon,
-                    "hourly": "precipitation,temperature_2m,relative_humidity_2m,wind_speed_10m",
-                    "forecast_days": 1,
-                    "timezone": "auto"
-                },
-                timeout=10.0
-            )
-            
-            if response.status_code != 200:
-                return {"status": "error", "message": "Weather API unavailable"}
-            
-            data = response.json()
-            hourly = data.get("hourly", {})
-            
-            # Format forecast data for frontend
-            forecast = []
-            times = hourly.get("time", [])
-            precipitations = hourly.get("precipitation", [])
-            temperatures = hourly.get("temperature_2m", [])
-            humidities = hourly.get("relative_humidity_2m", [])
-            wind_speeds = hourly.get("wind_speed_10m", [])
-            
-            for i in range(min(24, len(times))):
-                forecast.append({
-                    "hour": i,
-                    "time": times[i],
-                    "rainfall": precipitations[i] if i < len(precipitations) else 0,
-                    "temperature": temperatures[i] if i < len(temperatures) else 0,
-                    "humidity": humidities[i] if i < len(humidities) else 0,
-                    "wind_speed": wind_speeds[i] if i < len(wind_speeds) else 0
-                })
-            
-            # Calculate total accumulated rainfall
-            total_rainfall = sum(f["rainfall"] for f in forecast)
-            max_rainfall = max((f["rainfall"] for f in forecast), default=0)
-            avg_rainfall = total_rainfall / len(forecast) if forecast else 0
-            
-            return {
-                "status": "success",
-                "forecast": forecast,
-                "summary": {
-                    "total_rainfall": round(total_rainfall, 2),
-                    "max_rainfall": round(max_rainfall, 2),
-                    "avg_rainfall": round(avg_rainfall, 2)
-                }
+        response = await HTTP_CLIENT.get(
+            "https://api.open-meteo.com/v1/forecast",
+            params={
+                "latitude": lat,
+                "longitude": lon,
+                "hourly": "precipitation,temperature_2m,relative_humidity_2m,wind_speed_10m",
+                "forecast_days": 1,
+                "timezone": "auto"
+            },
+            timeout=10.0
+        )
+        
+        if response.status_code != 200:
+            return {"status": "error", "message": "Weather API unavailable"}
+        
+        data = orjson.loads(response.content)
+        hourly = data.get("hourly", {})
+        
+        # Format forecast data for frontend
+        times = hourly.get("time", [])
+        precipitations = hourly.get("precipitation", [])
+        temperatures = hourly.get("temperature_2m", [])
+        humidities = hourly.get("relative_humidity_2m", [])
+        wind_speeds = hourly.get("wind_speed_10m", [])
+        
+        # One row per forecast time (max 24); shorter or null series are padded with 0
+        n = min(24, len(times))
+        rain = [p or 0 for p in precipitations[:n]]
+        forecast = [
+            {"hour": i, "time": t, "rainfall": p, "temperature": temp or 0, "humidity": h or 0, "wind_speed": w or 0}
+            for i, (t, p, temp, h, w) in enumerate(zip_longest(
+                times[:n], rain, temperatures[:n], humidities[:n], wind_speeds[:n], fillvalue=0
+            ))
+        ]
+        
+        # Calculate total accumulated rainfall straight from the raw hourly values
+        total_rainfall = sum(rain)
+        max_rainfall = max(rain, default=0)
+        avg_rainfall = total_rainfall / n if n else 0
+        
+        return {
+            "status": "success",
+            "forecast": forecast,
+            "summary": {
+                "total_rainfall": round(total_rainfall, 2),
+                "max_rainfall": round(max_rainfall, 2),
+                "avg_rainfall": round(avg_rainfall, 2)
             }
-            
+        }
+        
     except Exception as e:
         logger.error(f"Weather forecast error: {e}")
         return {"status": "error", "message": str(e)}
 
+# Circuit breaker for the Overpass API: after repeated failed requests, skip it for a cooldown
+_OVERPASS_STATE = {"failures": 0, "open_until": 0.0}
+OVERPASS_FAILURE_THRESHOLD = 5
+OVERPASS_COOLDOWN_SECONDS = 60
+
+def _record_overpass_failure():
+    _OVERPASS_STATE["failures"] += 1
+    if _OVERPASS_STATE["failures"] >= OVERPASS_FAILURE_THRESHOLD:
+        _OVERPASS_STATE["open_until"] = time.time() + OVERPASS_COOLDOWN_SECONDS
+        logger.warning(f"Overpass circuit open for {OVERPASS_COOLDOWN_SECONDS}s after {_OVERPASS_STATE['failures']} failures")
+
+# Facility category and icon by OSM amenity/emergency tag
+_AMENITY_MAP = {
+    "hospital": ("Hospital", "🏥"),
+    "police": ("Police Station", "🚓"),
+    "fire_station": ("Fire Station", "🚒"),
+    "shelter": ("Shelter", "🏠"),
+    "assembly_point": ("Assembly Point", "📍"),
+}
+_DEFAULT_AMENITY = ("Safe Zone", "🛡️")
+
+async def _backoff(attempt: int):
+    # Jittered exponential backoff so concurrent retries don't arrive in lockstep
+    await asyncio.sleep(min(30.0, (2 ** attempt) + random.uniform(0, 0.5)))
+
 @app.get("/safe_zones")
 async def get_safe_zones(lat: float, lon: float, radius: float = 5.0):
     """Fetch nearby safe zones including hospitals, police stations, and shelters"""
+    if time.time() < _OVERPASS_STATE["open_until"]:
+        return {
+            "status": "error",
+            "message": "Safe zones API is currently unavailable. Please try again later.",
+            "safe_zones": []
+        }
+    
     try:
         # Search radius in kilometers (converted to degrees approximately)
         radius_deg = radius / 111.0  # 1 degree ≈ 111 km
@@ -416,34 +647,34 @@ async def get_safe_zones(lat: float, lon: float, radius: float = 5.0):
         
         # Retry logic with exponential backoff
         max_retries = 3
-        retry_delay = 2  # seconds
         
         for attempt in range(max_retries):
             try:
-                async with httpx.AsyncClient(timeout=60.0) as client:
-                    response = await client.post(
-                        overpass_url,
-                        data=query
-                    )
-                    
-                    if response.status_code == 200:
-                        break
-                    elif response.status_code == 504:
-                        logger.warning(f"Overpass API timeout (attempt {attempt + 1}/{max_retries})")
-                        if attempt < max_retries - 1:
-                            await asyncio.sleep(retry_delay * (attempt + 1))
-                            continue
-                    else:
-                        logger.error(f"Overpass API error: {response.status_code}")
-                        if attempt < max_retries - 1:
-                            await asyncio.sleep(retry_delay)
-                            continue
+                response = await HTTP_CLIENT.post(
+                    overpass_url,
+                    data=query,
+                    timeout=60.0
+                )
+                
+                if response.status_code == 200:
+                    break
+                elif response.status_code == 504:
+                    logger.warning(f"Overpass API timeout (attempt {attempt + 1}/{max_retries})")
+                    if attempt < max_retries - 1:
+                        await _backoff(attempt)
+                        continue
+                else:
+                    logger.error(f"Overpass API error: {response.status_code}")
+                    if attempt < max_retries - 1:
+                        await _backoff(attempt)
+                        continue
             except httpx.TimeoutException:
                 logger.warning(f"Overpass API request timeout (attempt {attempt + 1}/{max_retries})")
                 if attempt < max_retries - 1:
-                    await asyncio.sleep(retry_delay * (attempt + 1))
+                    await _backoff(attempt)
                     continue
                 else:
+                    _record_overpass_failure()
                     return {
                         "status": "error",
                         "message": "Safe zones API is currently unavailable. Please try again later.",
@@ -452,9 +683,10 @@ async def get_safe_zones(lat: float, lon: float, radius: float = 5.0):
             except Exception as e:
                 logger.error(f"Overpass API request failed: {str(e)}")
                 if attempt < max_retries - 1:
-                    await asyncio.sleep(retry_delay)
+                    await _backoff(attempt)
                     continue
                 else:
+                    _record_overpass_failure()
                     return {
                         "status": "error",
                         "message": "Safe zones API encountered an error",
@@ -462,43 +694,30 @@ async def get_safe_zones(lat: float, lon: float, radius: float = 5.0):
                     }
         
         if response.status_code != 200:
+            _record_overpass_failure()
             return {
                 "status": "error",
                 "message": f"Safe zones API unavailable (HTTP {response.status_code})",
                 "safe_zones": []
             }
         
-        data = response.json()
+        _OVERPASS_STATE["failures"] = 0
+        
+        data = orjson.loads(response.content)
         elements = data.get("elements", [])
         
+        # Calculate all distances in one vectorized pass
+        lats2 = [e.get("lat", 0) for e in elements]
+        lons2 = [e.get("lon", 0) for e in elements]
+        distances = calculate_distances(lat, lon, lats2, lons2)
+        
         safe_zones = []
-        for elem in elements:
+        for elem, lat2, lon2, distance in zip(elements, lats2, lons2, distances.tolist()):
             amenity = elem.get("tags", {}).get("amenity", elem.get("tags", {}).get("emergency", "unknown"))
             name = elem.get("tags", {}).get("name", f"Unnamed {amenity}")
             
-            # Calculate distance
-            lat2, lon2 = elem.get("lat", 0), elem.get("lon", 0)
-            distance = calculate_distance(lat, lon, lat2, lon2)
-            
             # Categorize facility type
-            if amenity == "hospital":
-                category = "Hospital"
-                icon = "🏥"
-            elif amenity == "police":
-                category = "Police Station"
-                icon = "🚓"
-            elif amenity == "fire_station":
-                category = "Fire Station"
-                icon = "🚒"
-            elif amenity == "shelter":
-                category = "Shelter"
-                icon = "🏠"
-            elif amenity == "assembly_point":
-                category = "Assembly Point"
-                icon = "📍"
-            else:
-                category = "Safe Zone"
-                icon = "🛡️"
+            category, icon = _AMENITY_MAP.get(amenity, _DEFAULT_AMENITY)
             
             safe_zones.append({
                 "name": name,
@@ -523,19 +742,25 @@ async def get_safe_zones(lat: float, lon: float, radius: float = 5.0):
         logger.error(f"Safe zones error: {e}")
         return {"status": "error", "message": str(e)}
 
-def calculate_distance(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
-    """Calculate distance between two coordinates in kilometers using Haversine formula"""
+def calculate_distances(lat1: float, lon1: float, lats2, lons2, out=None):
+    """Vectorized Haversine distances in kilometers from one point to arrays of coordinates.
+    Intermediates are updated in place; pass `out` to reuse a preallocated result array."""
+    import numpy as np  # Lazy import keeps NumPy out of worker startup
+    
     R = 6371  # Earth's radius in km
     
     lat1_rad = math.radians(lat1)
-    lat2_rad = math.radians(lat2)
-    delta_lat = math.radians(lat2 - lat1)
-    delta_lon = math.radians(lon2 - lon1)
-    
-    a = math.sin(delta_lat/2)**2 + math.cos(lat1_rad) * math.cos(lat2_rad) * math.sin(delta_lon/2)**2
-    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1-a))
+    lats2_rad = np.radians(np.asarray(lats2, dtype=np.float64))
+    sin_dlat = np.sin((lats2_rad - lat1_rad) / 2)
+    sin_dlon = np.sin(np.radians(np.asarray(lons2, dtype=np.float64) - lon1) / 2)
     
-    return R * c
+    a = sin_dlat * sin_dlat
+    a += math.cos(lat1_rad) * np.cos(lats2_rad) * (sin_dlon * sin_dlon)
+    np.minimum(a, 1.0, out=a)
+    np.sqrt(a, out=a)
+    out = np.arcsin(a, out=out)
+    out *= 2 * R
+    return out
 
 @app.get("/local_news")
 async def get_local_news(lat: float, lon: float):
@@ -547,49 +772,48 @@ async def get_local_news(lat: float, lon: float):
         # Search for weather/disaster news
         query = f"{location_name} weather OR disaster OR flood OR landslide OR rainfall OR storm"
         
-        async with httpx.AsyncClient() as client:
-            # Using NewsAPI (you can also use GNews or other free APIs)
-            response = await client.get(
-                "https://gnews.io/api/v4/search",
-                params={
-                    "q": query,
-                    "lang": "en",
-                    "country": "in",
-                    "max": 6,
-                    "apikey": os.getenv("GNEWS_API_KEY", "demo")  # Add your GNews API key to .env
-                },
-                timeout=15.0
-            )
+        # Using NewsAPI (you can also use GNews or other free APIs)
+        response = await HTTP_CLIENT.get(
+            "https://gnews.io/api/v4/search",
+            params={
+                "q": query,
+                "lang": "en",
+                "country": "in",
+                "max": 6,
+                "apikey": os.getenv("GNEWS_API_KEY", "demo")  # Add your GNews API key to .env
+            },
+            timeout=15.0
+        )
+        
+        if response.status_code == 200:
+            data = orjson.loads(response.content)
+            articles = data.get("articles", [])
+            
+            # Filter and format articles
+            news_items = []
+            for article in articles[:6]:
+                news_items.append({
+                    "title": article.get("title", ""),
+                    "description": article.get("description", ""),
+                    "source": article.get("source", {}).get("name", "Unknown"),
+                    "url": article.get("url", ""),
+                    "published_at": article.get("publishedAt", ""),
+                    "image": article.get("image", "")
+                })
+            
+            return {
+                "status": "success",
+                "location": location_name,
+                "news": news_items
+            }
+        else:
+            # Return empty news list if API fails
+            return {
+                "status": "success",
+                "location": location_name,
+                "news": []
+            }
             
-            if response.status_code == 200:
-                data = response.json()
-                articles = data.get("articles", [])
-                
-                # Filter and format articles
-                news_items = []
-                for article in articles[:6]:
-                    news_items.append({
-                        "title": article.get("title", ""),
-                        "description": article.get("description", ""),
-                        "source": article.get("source", {}).get("name", "Unknown"),
-                        "url": article.get("url", ""),
-                        "published_at": article.get("publishedAt", ""),
-                        "image": article.get("image", "")
-                    })
-                
-                return {
-                    "status": "success",
-                    "location": location_name,
-                    "news": news_items
-                }
-            else:
-                # Return empty news list if API fails
-                return {
-                    "status": "success",
-                    "location": location_name,
-                    "news": []
-                }
-                
     except Exception as e:
         logger.error(f"News fetch error: {e}")
         return {
@@ -598,51 +822,202 @@ async def get_local_news(lat: float, lon: float):
             "news": []
         }
 
+# Reverse-geocoding results per ~100m tile; place names effectively never change
+_LOCATION_CACHE = TTLCache(maxsize=10000, ttl=86400)
+_LOCATION_INFLIGHT = {}
+
 async def get_location_name(lat: float, lon: float) -> str:
     """Get approximate location name from coordinates"""
+    key = (round(lat, 3), round(lon, 3))
+    name = await _cached_lookup(_LOCATION_CACHE, _LOCATION_INFLIGHT, key, lambda: _fetch_location_name(lat, lon))
+    return name or "Selected Area"
+
+async def _fetch_location_name(lat: float, lon: float):
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.get(
-                "https://nominatim.openstreetmap.org/reverse",
-                params={
-                    "lat": lat,
-                    "lon": lon,
-                    "format": "json"
-                },
-                headers={"User-Agent": "Kavach-DisasterApp/1.0"},
-                timeout=10.0
-            )
-            if response.status_code == 200:
-                data = response.json()
-                address = data.get("address", {})
-                # Get city, state, or country
-                return (address.get("city") or 
-                       address.get("state_district") or 
-                       address.get("state") or 
-                       address.get("country") or 
-                       "Unknown Location")
+        response = await HTTP_CLIENT.get(
+            "https://nominatim.openstreetmap.org/reverse",
+            params={
+                "lat": lat,
+                "lon": lon,
+                "format": "json"
+            },
+            headers={"User-Agent": "Kavach-DisasterApp/1.0"},
+            timeout=10.0
+        )
+        if response.status_code == 200:
+            data = orjson.loads(response.content)
+            address = data.get("address", {})
+            # Get city, state, or country
+            return (address.get("city") or 
+                   address.get("state_district") or 
+                   address.get("state") or 
+                   address.get("country") or 
+                   "Unknown Location")
     except:
         pass
-    return "Selected Area"
+    return None
+
+# --- ALERT STATE STORAGE ---
+# Redis when REDIS_URL is set (shared across workers, native expiry); otherwise these in-process structures
+ALERT_HISTORY_MAX = 10_000
+OTP_TTL_SECONDS = 600
 
-# In-memory storage for alerts (use database in production)
-alert_history = []
+alert_history = deque(maxlen=ALERT_HISTORY_MAX)  # Oldest alerts drop off once full
+_next_alert_id = count(1)
 user_alert_settings = {}
+otp_storage = {}  # {user_id: {phone: str, otp: str, expiry: time.monotonic() deadline, verified: bool}}
+
+class UserPrefs(NamedTuple):
+    """Fields /alert/check reads from a user's settings"""
+    landslide_threshold: int = 70
+    flood_threshold: int = 60
+    rainfall_threshold: int = 100
+    email: str = ""
+    phone: str = ""
+    enable_email: bool = False
+    enable_sms: bool = False
+
+# Short TTL so workers sharing Redis pick up settings saved by another worker
+PREFS_CACHE_TTL = 30
+_PREFS_CACHE = TTLCache(maxsize=1024, ttl=PREFS_CACHE_TTL)
+
+async def get_user_settings(user_id: str) -> dict:
+    if redis_client is None:
+        return user_alert_settings.get(user_id, {})
+    raw = await redis_client.get(f"settings:{user_id}")
+    return orjson.loads(raw) if raw else {}
+
+async def set_user_settings(user_id: str, settings: dict):
+    if redis_client is None:
+        user_alert_settings[user_id] = settings
+    else:
+        await redis_client.set(f"settings:{user_id}", orjson.dumps(settings))
+    _PREFS_CACHE.pop(user_id, None)
+
+async def get_user_prefs(user_id: str):
+    """Cached UserPrefs for a user, or None if they haven't saved settings"""
+    prefs = _PREFS_CACHE.get(user_id)
+    if prefs is None:
+        settings = await get_user_settings(user_id)
+        if not settings:
+            return None
+        prefs = UserPrefs._make(settings.get(field, default) for field, default in UserPrefs._field_defaults.items())
+        _PREFS_CACHE[user_id] = prefs
+    return prefs
+
+async def get_all_user_settings() -> dict:
+    if redis_client is None:
+        return user_alert_settings
+    keys = [key async for key in redis_client.scan_iter("settings:*")]
+    values = await redis_client.mget(keys) if keys else []
+    return {key.split(":", 1)[1]: orjson.loads(value) for key, value in zip(keys, values) if value}
+
+async def record_alerts(alerts: list):
+    """Assign ids to newly triggered alerts and append them to the history"""
+    if redis_client is None:
+        for alert in alerts:
+            alert["id"] = next(_next_alert_id)
+            alert_history.append(alert)
+        return
+    last_id = await redis_client.incrby("alerts:next_id", len(alerts))
+    for offset, alert in enumerate(alerts, start=last_id - len(alerts) + 1):
+        alert["id"] = offset
+    async with redis_client.pipeline(transaction=False) as pipe:
+        pipe.rpush("alerts", *(orjson.dumps(alert) for alert in alerts))
+        pipe.ltrim("alerts", -ALERT_HISTORY_MAX, -1)
+        await pipe.execute()
+
+async def get_recent_alerts(limit: int) -> list:
+    if redis_client is None:
+        return list(islice(alert_history, max(len(alert_history) - limit, 0), None))
+    if limit <= 0:
+        return []
+    return [orjson.loads(alert) for alert in await redis_client.lrange("alerts", -limit, -1)]
+
+async def clear_alerts():
+    if redis_client is None:
+        alert_history.clear()
+    else:
+        await redis_client.delete("alerts")
+
+async def save_otp(user_id: str, phone: str, otp: str):
+    if redis_client is None:
+        otp_storage[user_id] = {
+            "phone": phone,
+            "otp": otp,
+            "expiry": time.monotonic() + OTP_TTL_SECONDS,
+            "verified": False
+        }
+        return
+    key = f"otp:{user_id}"
+    async with redis_client.pipeline() as pipe:
+        pipe.delete(key)
+        pipe.hset(key, mapping={"phone": phone, "otp": otp, "verified": 0})
+        pipe.expire(key, OTP_TTL_SECONDS)
+        await pipe.execute()
+
+async def get_otp(user_id: str):
+    """Stored OTP entry, or None if missing or expired (verified entries don't expire)"""
+    if redis_client is None:
+        entry = otp_storage.get(user_id)
+        if entry and not entry["verified"] and time.monotonic() > entry["expiry"]:
+            del otp_storage[user_id]
+            return None
+        return entry
+    entry = await redis_client.hgetall(f"otp:{user_id}")
+    if "phone" not in entry:  # Missing, or a stray hash left without its OTP fields
+        return None
+    return {"phone": entry["phone"], "otp": entry["otp"], "verified": entry["verified"] == "1"}
+
+# Only flag an OTP that still exists; HSET on an expired key would create a hash with no phone/otp
+_MARK_OTP_VERIFIED_LUA = """
+if redis.call("EXISTS", KEYS[1]) == 0 then return 0 end
+redis.call("HSET", KEYS[1], "verified", 1)
+redis.call("PERSIST", KEYS[1])
+return 1
+"""
+_mark_otp_verified_script = redis_client.register_script(_MARK_OTP_VERIFIED_LUA) if redis_client is not None else None
+
+async def mark_otp_verified(user_id: str) -> bool:
+    """Mark the OTP verified and keep it past its TTL; False if it expired meanwhile"""
+    if redis_client is None:
+        entry = otp_storage.get(user_id)
+        if entry is None:
+            return False
+        entry["verified"] = True
+        return True
+    return bool(await _mark_otp_verified_script(keys=[f"otp:{user_id}"]))
+
+# Alert rules: (type, input key, UserPrefs threshold field, WARNING at, EMERGENCY at, message template)
+ALERT_RULES = [
+    ("Landslide", "landslide_risk", "landslide_threshold", 70, 85, "Landslide risk at {value}% exceeds threshold"),
+    ("Flood", "flood_risk", "flood_threshold", 60, 80, "Flood risk at {value}% exceeds threshold"),
+    ("Heavy Rainfall", "rainfall", "rainfall_threshold", 100, 150, "Rainfall at {value}mm exceeds threshold"),
+]
+
+SMS_TEMPLATE = "🚨 {level} Alert: {type} - {message} at your Location. Stay safe!"
+SMS_BATCH_HEADER = "🚨 ALERTS:"
+SMS_BATCH_LINE = "{level} {type}: {value}"
+
+def format_sms_body(alerts: list) -> str:
+    """One SMS body for all alerts going to the same phone"""
+    if len(alerts) == 1:
+        return SMS_TEMPLATE.format_map(alerts[0])
+    return "\n".join([SMS_BATCH_HEADER, *(SMS_BATCH_LINE.format_map(a) for a in alerts)])
+
+# An alert (same user, type and level) delivered on a channel isn't sent on that channel again within this window;
+# keys are reserved as "pending" while a send is in flight so overlapping checks don't send it twice
+DEDUP_WINDOW_SECONDS = 300
+_last_alert_sent = TTLCache(maxsize=10_000, ttl=DEDUP_WINDOW_SECONDS)  # {(user_id, type, level, channel): "pending" | "sent"}
 
 # SMS and Email sending functions
 async def send_email_alert(to_email: str, alert_data: dict):
     """Send email alert using Resend API"""
     try:
-        resend_api_key = os.getenv("RESEND_API_KEY", "")
-        sender_email = os.getenv("SENDER_EMAIL", "")
-        
-        if not resend_api_key:
+        if not RESEND_API_KEY:
             logger.warning("Resend API key not configured")
             return False
         
-        import resend
-        resend.api_key = resend_api_key
-        
         # Email HTML body
         html_content = f"""
         <html>
@@ -675,213 +1050,232 @@ async def send_email_alert(to_email: str, alert_data: dict):
             "html": html_content,
         }
         
-        logger.info(f"📧 Attempting to send email to: {to_email}")
-        email = resend.Emails.send(params)
-        logger.info(f"✅ EMAIL SENT SUCCESSFULLY to: {to_email} (ID: {email['id']})")
+        email = await asyncio.to_thread(resend.Emails.send, params)
+        logger.debug("Email sent to %s (ID: %s)", to_email, email["id"])
         return True
     except Exception as e:
-        logger.error(f"Email send error: {e}")
+        logger.error("Email send error: %s", e)
         return False
 
-async def send_sms_alert(to_phone: str, alert_data: dict):
+TWILIO_OVERLOAD_CODES = {20429, 21611}  # Too Many Requests, message queue full
+TWILIO_RETRY_AFTER_SECONDS = 1.0
+
+async def send_twilio_sms(to_phone: str, body: str):
+    """Send one SMS through Twilio, backing off concurrency when Twilio pushes back"""
+    async with sms_concurrency:
+        await sms_rate_limiter.acquire()
+        try:
+            # Twilio SDK is synchronous; run it off the event loop
+            message = await asyncio.to_thread(
+                app.state.twilio_client.messages.create,
+                body=body,
+                **TWILIO_SENDER,
+                to=to_phone
+            )
+        except TwilioRestException as e:
+            if e.status == 429 or e.code in TWILIO_OVERLOAD_CODES:
+                sms_concurrency.overload(TWILIO_RETRY_AFTER_SECONDS)
+            raise
+        sms_concurrency.success()
+        return message
+
+async def send_sms_alert(to_phone: str, alerts: list):
     """Send SMS alert using Twilio or other SMS service"""
+    body = format_sms_body(alerts)
     try:
         # Option 1: Using Twilio (FREE TRIAL - Works internationally)
-        twilio_sid = os.getenv("TWILIO_ACCOUNT_SID", "")
-        twilio_token = os.getenv("TWILIO_AUTH_TOKEN", "")
-        twilio_phone = os.getenv("TWILIO_PHONE_NUMBER", "")
-        
-        if all([twilio_sid, twilio_token, twilio_phone]):
+        if TWILIO_ENABLED:
             try:
-                from twilio.rest import Client
-                client = Client(twilio_sid, twilio_token)
-                message = client.messages.create(
-                    body=f"🚨 {alert_data['level']} Alert: {alert_data['type']} - {alert_data['message']} at your Location. Stay safe!",
-                    from_=twilio_phone,
-                    to=to_phone if to_phone.startswith('+') else f"+91{to_phone}"
-                )
-                logger.info(f"SMS alert sent via Twilio to: {to_phone}")
+                await send_twilio_sms(to_phone, body)
+                logger.debug("SMS alert sent via Twilio to: %s", to_phone)
                 return True
             except Exception as twilio_error:
-                logger.error(f"Twilio error: {twilio_error}")
+                logger.error("Twilio error: %s", twilio_error)
         
         # Option 2: Using Fast2SMS (India-specific - REQUIRES PAYMENT)
         # COMMENTED OUT - Requires 100 INR minimum payment
         # fast2sms_api_key = os.getenv("FAST2SMS_API_KEY", "")
         # 
         # if fast2sms_api_key:
-        #     message_text = f"KAVACH ALERT: {alert_data['level']} - {alert_data['type']} at {alert_data['location']}. {alert_data['message']}"
+        #     response = await HTTP_CLIENT.post(
+        #         "https://www.fast2sms.com/dev/bulkV2",
+        #         headers={
+        #             "authorization": fast2sms_api_key,
+        #             "Content-Type": "application/json"
+        #         },
+        #         json={
+        #             "route": "q",
+        #             "message": body,
+        #             "language": "english",
+        #             "flash": 0,
+        #             "numbers": to_phone.replace("+91", "").replace("+", "")
+        #         },
+        #         timeout=10.0
+        #     )
         #     
-        #     async with httpx.AsyncClient() as client:
-        #         response = await client.post(
-        #             "https://www.fast2sms.com/dev/bulkV2",
-        #             headers={
-        #                 "authorization": fast2sms_api_key,
-        #                 "Content-Type": "application/json"
-        #             },
-        #             json={
-        #                 "route": "q",
-        #                 "message": message_text,
-        #                 "language": "english",
-        #                 "flash": 0,
-        #                 "numbers": to_phone.replace("+91", "").replace("+", "")
-        #             },
-        #             timeout=10.0
-        #         )
-        #         
-        #         if response.status_code == 200:
-        #             resp_data = response.json()
-        #             if resp_data.get("status_code") == 999:
-        #                 print(f"⚠️ Fast2SMS: Account needs payment (100 INR minimum)")
-        #                 print(f"📱 DEMO MODE - SMS Alert to {to_phone}: {alert_data['level']} - {alert_data['message']}")
-        #                 return True
-        #             print(f"✅ SMS sent via Fast2SMS to: {to_phone}")
+        #     if response.status_code == 200:
+        #         resp_data = response.json()
+        #         if resp_data.get("status_code") == 999:
+        #             print(f"⚠️ Fast2SMS: Account needs payment (100 INR minimum)")
+        #             print(f"📱 DEMO MODE - SMS Alert to {to_phone}: {body}")
         #             return True
-        #         else:
-        #             print(f"❌ SMS send failed: {response.text}")
+        #         print(f"✅ SMS sent via Fast2SMS to: {to_phone}")
+        #         return True
+        #     else:
+        #         print(f"❌ SMS send failed: {response.text}")
         
         # SMS service not configured
-        logger.warning(f"SMS service unavailable - Alert not sent to {to_phone}")
+        logger.warning("SMS service unavailable - Alert not sent to %s", to_phone)
         return False
             
     except Exception as e:
-        logger.error(f"SMS send error: {e}")
+        logger.error("SMS send error: %s", e)
         return False
 
 @app.post("/alert/settings")
 async def save_alert_settings(settings: AlertSettings, user_id: str = "default"):
     """Save user alert settings"""
-    user_alert_settings[user_id] = settings.dict()
+    if settings.phone:
+        try:
+            settings.phone = _normalize_phone(settings.phone)
+        except ValueError as e:
+            # Only block the save when SMS depends on the number; otherwise keep it as typed
+            if settings.enable_sms:
+                return {"status": "error", "message": str(e)}
+    await set_user_settings(user_id, settings.model_dump())
     return {"status": "success", "message": "Alert settings saved"}
 
 @app.get("/alert/settings")
 async def get_alert_settings(user_id: str = "default"):
     """Get user alert settings"""
-    settings = user_alert_settings.get(user_id, {
-        "email": "",
-        "phone": "",
-        "landslide_threshold": 70,
-        "flood_threshold": 60,
-        "rainfall_threshold": 100,
-        "enable_email": False,
-        "enable_sms": False,
-        "alert_location": "",
-        "alert_lat": None,
-        "alert_lng": None
-    })
+    settings = await get_user_settings(user_id) or _DEFAULT_ALERT_SETTINGS
     return {"status": "success", "settings": settings}
 
 @app.get("/alert/debug")
 async def debug_alert_settings():
     """Debug endpoint to see all stored settings"""
+    all_settings = await get_all_user_settings()
     return {
         "status": "success",
-        "all_users": list(user_alert_settings.keys()),
-        "settings_by_user": user_alert_settings
+        "all_users": list(all_settings.keys()),
+        "settings_by_user": all_settings
     }
 
 @app.post("/alert/check")
-async def check_alerts(data: dict = Body(...), user_id: str = "default"):
+async def check_alerts(data: AlertCheckInput, user_id: str = "default"):
     """Check if current conditions trigger an alert"""
-    landslide_risk = data.get("landslide_risk", 0)
-    flood_risk = data.get("flood_risk", 0)
-    rainfall = data.get("rainfall", 0)
-    location = data.get("location", "Unknown Location")
+    location = data.location
     
-    logger.info(f"🔍 Alert check requested for user: {user_id}")
-    logger.info(f"📊 Risk values - Landslide: {landslide_risk}%, Flood: {flood_risk}%, Rainfall: {rainfall}mm")
+    logger.debug("Alert check requested for user: %s", user_id)
+    logger.debug("Risk values - Landslide: %s%%, Flood: %s%%, Rainfall: %smm",
+                 data.landslide_risk, data.flood_risk, data.rainfall)
     
-    settings = user_alert_settings.get(user_id, {})
-    logger.info(f"⚙️ User settings: {settings}")
+    prefs = await get_user_prefs(user_id)
+    logger.debug("User settings: %s", prefs)
     
-    if not settings:
-        logger.warning(f"⚠️ No settings found for user {user_id}")
+    if prefs is None:
+        logger.warning("No settings found for user %s", user_id)
         return {"status": "success", "alerts": [], "message": "No settings configured"}
     
     alerts = []
-    current_time = time.strftime("%Y-%m-%d %H:%M:%S")
+    current_time = datetime.now().isoformat(sep=" ", timespec="seconds")  # Same "YYYY-MM-DD HH:MM:SS" format
     
-    # Check landslide threshold
-    if landslide_risk >= settings.get("landslide_threshold", 70):
-        level = "EMERGENCY" if landslide_risk >= 85 else "WARNING" if landslide_risk >= 70 else "WATCH"
+    # Check each hazard against the user's threshold
+    for alert_type, value_key, threshold_key, warning_at, emergency_at, message_template in ALERT_RULES:
+        value = getattr(data, value_key)
+        threshold = getattr(prefs, threshold_key)
+        if value < threshold:
+            continue
+        level = "EMERGENCY" if value >= emergency_at else "WARNING" if value >= warning_at else "WATCH"
         alert = {
-            "id": len(alert_history) + 1,
-            "type": "Landslide",
+            "type": alert_type,
             "level": level,
-            "value": landslide_risk,
-            "threshold": settings.get("landslide_threshold"),
-            "message": f"Landslide risk at {landslide_risk}% exceeds threshold",
+            "value": value,
+            "threshold": threshold,
+            "message": message_template.format(value=value),
             "location": location,
             "timestamp": current_time
         }
         alerts.append(alert)
-        alert_history.append(alert)
     
-    # Check flood threshold
-    if flood_risk >= settings.get("flood_threshold", 60):
-        level = "EMERGENCY" if flood_risk >= 80 else "WARNING" if flood_risk >= 60 else "WATCH"
-        alert = {
-            "id": len(alert_history) + 1,
-            "type": "Flood",
-            "level": level,
-            "value": flood_risk,
-            "threshold": settings.get("flood_threshold"),
-            "message": f"Flood risk at {flood_risk}% exceeds threshold",
-            "location": location,
-            "timestamp": current_time
-        }
-        alerts.append(alert)
-        alert_history.append(alert)
-    
-    # Check rainfall threshold
-    if rainfall >= settings.get("rainfall_threshold", 100):
-        level = "EMERGENCY" if rainfall >= 150 else "WARNING" if rainfall >= 100 else "WATCH"
-        alert = {
-            "id": len(alert_history) + 1,
-            "type": "Heavy Rainfall",
-            "level": level,
-            "value": rainfall,
-            "threshold": settings.get("rainfall_threshold"),
-            "message": f"Rainfall at {rainfall}mm exceeds threshold",
-            "location": location,
-            "timestamp": current_time
-        }
-        alerts.append(alert)
-        alert_history.append(alert)
+    if alerts:
+        await record_alerts(alerts)
     
     # Send actual SMS/Email notifications
     email_sent = False
     sms_sent = False
+    enable_email, email, enable_sms, phone = prefs.enable_email, prefs.email, prefs.enable_sms, prefs.phone
+    needs_notify = bool((enable_email and email) or (enable_sms and phone))
     
-    if alerts:
-        logger.info(f"🚨 {len(alerts)} alert(s) triggered for user {user_id}")
-        logger.info(f"🔐 Email enabled: {settings.get('enable_email')}, Email address: {settings.get('email')}")
-        logger.info(f"🔐 SMS enabled: {settings.get('enable_sms')}, Phone: {settings.get('phone')}")
+    if alerts and not needs_notify:
+        logger.info("%d alert(s) triggered for user %s - notifications disabled", len(alerts), user_id)
+    elif alerts:
+        logger.info("%d alert(s) triggered for user %s", len(alerts), user_id)
+        logger.debug("Email enabled: %s, Email address: %s", enable_email, email)
+        logger.debug("SMS enabled: %s, Phone: %s", enable_sms, phone)
         
+        # Queue every notification, then send them all concurrently
+        tasks = []
+        channels = []
+        task_keys = []  # Dedup keys each task covers: reserved as pending now, kept only if the send succeeds
+        sms_alerts = []  # Batched into a single SMS below
+        sms_keys = []
         for alert in alerts:
-            if settings.get("enable_email") and settings.get("email"):
-                logger.info(f"📧 Attempting to send email to: {settings.get('email')}")
-                email_result = await send_email_alert(settings.get("email"), alert)
-                if email_result:
-                    email_sent = True
-                    logger.info(f"✅ Email sent successfully!")
+            if enable_email and email:
+                dedup_key = (user_id, alert["type"], alert["level"], "email")
+                if dedup_key in _last_alert_sent:
+                    logger.debug("Duplicate %s %s email for user %s - notification suppressed", alert["level"], alert["type"], user_id)
                 else:
-                    logger.error(f"❌ Email failed to send!")
+                    logger.debug("Attempting to send email to: %s", email)
+                    _last_alert_sent[dedup_key] = "pending"
+                    tasks.append(send_email_alert(email, alert))
+                    channels.append("email")
+                    task_keys.append([dedup_key])
             else:
-                logger.warning(f"⚠️ Email notification skipped - enabled: {settings.get('enable_email')}, has email: {bool(settings.get('email'))}")
+                logger.debug("Email notification skipped - enabled: %s, has email: %s", enable_email, bool(email))
             
-            if settings.get("enable_sms") and settings.get("phone"):
-                logger.info(f"📱 Attempting to send SMS to: {settings.get('phone')}")
-                sms_result = await send_sms_alert(settings.get("phone"), alert)
-                if sms_result:
-                    sms_sent = True
-                    logger.info(f"✅ SMS sent successfully!")
+            if enable_sms and phone:
+                dedup_key = (user_id, alert["type"], alert["level"], "sms")
+                if dedup_key in _last_alert_sent:
+                    logger.debug("Duplicate %s %s SMS for user %s - notification suppressed", alert["level"], alert["type"], user_id)
                 else:
-                    logger.error(f"❌ SMS failed to send!")
+                    _last_alert_sent[dedup_key] = "pending"
+                    sms_alerts.append(alert)
+                    sms_keys.append(dedup_key)
             else:
-                logger.warning(f"⚠️ SMS notification skipped - enabled: {settings.get('enable_sms')}, has phone: {bool(settings.get('phone'))}")
+                logger.debug("SMS notification skipped - enabled: %s, has phone: %s", enable_sms, bool(phone))
+        
+        if sms_alerts:
+            logger.debug("Attempting to send SMS with %d alert(s) to: %s", len(sms_alerts), phone)
+            tasks.append(send_sms_alert(phone, sms_alerts))
+            channels.append("sms")
+            task_keys.append(sms_keys)
+        
+        try:
+            results = await asyncio.gather(*tasks, return_exceptions=True)
+        except BaseException:
+            # Request cancelled mid-send; release the reservations so the next check retries
+            for keys in task_keys:
+                for dedup_key in keys:
+                    _last_alert_sent.pop(dedup_key, None)
+            raise
+        for channel, keys, result in zip(channels, task_keys, results):
+            for dedup_key in keys:
+                if result is True:
+                    _last_alert_sent[dedup_key] = "sent"  # Restarts the window from the actual send
+                else:
+                    _last_alert_sent.pop(dedup_key, None)  # Failed sends must not silence the alert
+            if result is True:
+                if channel == "email":
+                    email_sent = True
+                    logger.info("Email alert sent for user %s", user_id)
+                else:
+                    sms_sent = True
+                    logger.info("SMS alert sent for user %s", user_id)
+            else:
+                logger.error("%s alert failed to send for user %s", "Email" if channel == "email" else "SMS", user_id)
     else:
-        logger.info(f"ℹ️ No alerts triggered for user {user_id} (values below thresholds)")
+        logger.debug("No alerts triggered for user %s (values below thresholds)", user_id)
     
     return {
         "status": "success", 
@@ -897,20 +1291,19 @@ async def get_alert_history(limit: int = 50):
     """Get alert history"""
     return {
         "status": "success",
-        "alerts": alert_history[-limit:] if alert_history else []
+        "alerts": await get_recent_alerts(limit)
     }
 
 @app.delete("/alert/history")
 async def clear_alert_history():
     """Clear alert history"""
-    global alert_history
-    alert_history = []
+    await clear_alerts()
     return {"status": "success", "message": "Alert history cleared"}
 
 @app.post("/alert/check_saved_location")
 async def check_saved_location_alerts(user_id: str = "default"):
     """Check alerts for the user's saved alert location"""
-    settings = user_alert_settings.get(user_id, {})
+    settings = await get_user_settings(user_id)
     if not settings or not settings.get("alert_lat") or not settings.get("alert_lng"):
         return {
             "status": "error",
@@ -946,43 +1339,32 @@ async def check_saved_location_alerts(user_id: str = "default"):
         return {"status": "error", "message": str(e)}
 
 # --- OTP VERIFICATION SYSTEM ---
-# In-memory storage for OTPs (use database in production)
-otp_storage = {}  # {user_id: {phone: str, otp: str, expiry: datetime, verified: bool}}
 
 @app.post("/alert/send_verification_otp")
-async def send_verification_otp(data: dict = Body(...)):
+async def send_verification_otp(data: SendOtpInput):
     """Send OTP to phone number for verification"""
-    user_id = data.get("user_id", "default")
-    phone = data.get("phone", "")
+    user_id = data.user_id
+    phone = data.phone
     
     if not phone:
         return {"status": "error", "message": "Phone number is required"}
+    try:
+        phone = _normalize_phone(phone)
+    except ValueError as e:
+        return {"status": "error", "message": str(e)}
     
-    # Generate 6-digit OTP
-    otp = str(random.randint(100000, 999999))
-    expiry = datetime.now() + timedelta(minutes=10)
+    # Generate 6-digit OTP (cryptographically secure, full 000000-999999 range)
+    otp = f"{secrets.randbelow(1_000_000):06d}"
     
-    # Store OTP
-    otp_storage[user_id] = {
-        "phone": phone,
-        "otp": otp,
-        "expiry": expiry,
-        "verified": False
-    }
+    # Store OTP (expires after 10 minutes)
+    await save_otp(user_id, phone, otp)
     
     # Send OTP via Twilio
     try:
-        twilio_sid = os.getenv("TWILIO_ACCOUNT_SID", "")
-        twilio_token = os.getenv("TWILIO_AUTH_TOKEN", "")
-        twilio_phone = os.getenv("TWILIO_PHONE_NUMBER", "")
-        
-        if all([twilio_sid, twilio_token, twilio_phone]):
-            from twilio.rest import Client
-            client = Client(twilio_sid, twilio_token)
-            message = client.messages.create(
-                body=f"Your KAVACH verification code is: {otp}\n\nThis code will expire in 10 minutes.\n\nDo not share this code with anyone.",
-                from_=twilio_phone,
-                to=phone if phone.startswith('+') else f"+91{phone}"
+        if TWILIO_ENABLED:
+            await send_twilio_sms(
+                phone,
+                f"Your KAVACH verification code is: {otp}\n\nThis code will expire in 10 minutes.\n\nDo not share this code with anyone."
             )
             logger.info(f"OTP sent via Twilio to: {phone}")
             return {
@@ -1003,27 +1385,22 @@ async def send_verification_otp(data: dict = Body(...)):
         }
 
 @app.post("/alert/verify_otp")
-async def verify_otp(data: dict = Body(...)):
+async def verify_otp(data: VerifyOtpInput):
     """Verify OTP code"""
-    user_id = data.get("user_id", "default")
-    otp_entered = data.get("otp", "")
-    
-    if user_id not in otp_storage:
-        return {"status": "error", "message": "No OTP found. Please request a new one."}
-    
-    stored = otp_storage[user_id]
+    user_id = data.user_id
+    otp_entered = data.otp
     
-    # Check expiry
-    if datetime.now() > stored["expiry"]:
-        del otp_storage[user_id]
-        return {"status": "error", "message": "OTP expired. Please request a new one."}
+    stored = await get_otp(user_id)
+    if stored is None:
+        return {"status": "error", "message": "No OTP found or it has expired. Please request a new one."}
     
     # Check OTP
     if stored["otp"] != otp_entered:
         return {"status": "error", "message": "Invalid OTP. Please try again."}
     
     # Mark as verified
-    otp_storage[user_id]["verified"] = True
+    if not await mark_otp_verified(user_id):
+        return {"status": "error", "message": "No OTP found or it has expired. Please request a new one."}
     
     return {
         "status": "success",
@@ -1034,11 +1411,12 @@ async def verify_otp(data: dict = Body(...)):
 @app.get("/alert/verification_status")
 async def get_verification_status(user_id: str = "default"):
     """Check if user's phone is verified"""
-    if user_id in otp_storage and otp_storage[user_id].get("verified"):
+    stored = await get_otp(user_id)
+    if stored and stored["verified"]:
         return {
             "status": "success",
             "verified": True,
-            "phone": otp_storage[user_id]["phone"]
+            "phone": stored["phone"]
         }
     return {"status": "success", "verified": False}
 
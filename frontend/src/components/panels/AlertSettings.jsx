@@ -240,6 +240,8 @@ const AlertSettings = ({ isOpen, onClose, riskData, location }) => {
         setShowSuccess(true);
         setTimeout(() => setShowSuccess(false), 3000);
         console.log('✅ Settings saved successfully to backend!');
+      } else {
+        alert(`❌ ${data.message || 'Error saving settings. Please try again.'}`);
       }
     } catch (error) {
       console.error('❌ Error saving settings:', error);